@@ -47,12 +47,14 @@ class RegistryBackedProviderMixin:
                 was previously loaded. This is primarily used by tests.
         """
 
-        if cls.REGISTRY_CLASS is None:  # pragma: no cover - defensive programming
-            raise RuntimeError(f"{cls.__name__} must define REGISTRY_CLASS.")
-
+        # Fast path: providers call this from __init__ and capability lookups,
+        # so an already-loaded registry must cost a single attribute check.
         if cls._registry is not None and not force_reload:
             return
 
+        if cls.REGISTRY_CLASS is None:  # pragma: no cover - defensive programming
+            raise RuntimeError(f"{cls.__name__} must define REGISTRY_CLASS.")
+
         try:
             registry = cls.REGISTRY_CLASS()
         except Exception as exc:  # pragma: no cover - registry failures shouldn't break the provider
@@ -1,6 +1,7 @@
 """X.AI (GROK) model provider implementation."""
 
 import logging
+from functools import lru_cache
 from typing import TYPE_CHECKING, ClassVar, Optional
 
 if TYPE_CHECKING:
@@ -52,34 +53,30 @@ class XAIModelProvider(RegistryBackedProviderMixin, OpenAICompatibleProvider):
         Returns:
             Preferred model name or None
         """
-        from tools.models import ToolModelCategory
-
         if not allowed_models:
             return None
 
-        if category == ToolModelCategory.EXTENDED_REASONING:
-            # Prefer Grok 4.1 Fast Reasoning for advanced tasks
-            if self.PRIMARY_MODEL in allowed_models:
-                return self.PRIMARY_MODEL
-            if self.FALLBACK_MODEL in allowed_models:
-                return self.FALLBACK_MODEL
-            return allowed_models[0]
-
-        elif category == ToolModelCategory.FAST_RESPONSE:
-            # Prefer Grok 4.1 Fast Reasoning for speed as well (latest fast SKU).
-            if self.PRIMARY_MODEL in allowed_models:
-                return self.PRIMARY_MODEL
-            if self.FALLBACK_MODEL in allowed_models:
-                return self.FALLBACK_MODEL
-            return allowed_models[0]
-
-        else:  # BALANCED or default
-            # Prefer Grok 4.1 Fast Reasoning for balanced use.
-            if self.PRIMARY_MODEL in allowed_models:
-                return self.PRIMARY_MODEL
-            if self.FALLBACK_MODEL in allowed_models:
-                return self.FALLBACK_MODEL
-            return allowed_models[0]
+        # Grok 4.1 Fast Reasoning leads for every category (reasoning, speed and
+        # balanced use alike), so the choice depends only on the allowed models.
+        # The order is read from the class on every call, so subclasses and
+        # patched PRIMARY_MODEL/FALLBACK_MODEL values are honoured by the cache.
+        cls = type(self)
+        return _select_preferred((cls.PRIMARY_MODEL, cls.FALLBACK_MODEL), tuple(allowed_models))
+
+
+# Memoized: the choice depends only on the preference order and the allowed models
+@lru_cache(maxsize=64)
+def _select_preferred(preference_order: tuple[str, ...], allowed_models: tuple[str, ...]) -> str:
+    """Return the first model of ``preference_order`` present in ``allowed_models``.
+
+    Both tuples are part of the cache key. ``allowed_models`` keeps the caller's
+    ordering so the ``allowed_models[0]`` fallback stays stable across cache hits.
+    """
+    allowed = frozenset(allowed_models)
+    for model in preference_order:
+        if model in allowed:
+            return model
+    return allowed_models[0]
 
 
 # Load registry data at import time
@@ -4,15 +4,42 @@ Test script to verify FileStorage solves the cross-subprocess persistence issue.
 Simulates the Claude/Agent Zero subprocess execution scenario.
 """
 
+import multiprocessing
 import os
-import subprocess
 import sys
-import time
 from pathlib import Path
 
 # Add the current directory to Python path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
+from utils.conversation_memory import add_turn, create_thread, get_thread
+
+
+def create_thread_worker():
+    """Create a thread with one turn (runs inside a pool worker)"""
+    thread_id = create_thread('test_tool', {'test': 'data'})
+    success = add_turn(thread_id, 'user', 'Test message from subprocess 1', tool_name='test_tool')
+    return thread_id, success
+
+
+def continue_thread_worker(thread_id):
+    """Retrieve a thread and append a turn (runs inside a pool worker)"""
+    context = get_thread(thread_id)
+    if not context:
+        return False, None, 0, False
+
+    success = add_turn(thread_id, 'assistant', 'Response from subprocess 2', tool_name='test_tool')
+    return True, context.tool_name, len(context.turns), success
+
+
+def verify_thread_worker(thread_id):
+    """Return (role, tool_name) for every turn in a thread (runs inside a pool worker)"""
+    context = get_thread(thread_id)
+    if not context:
+        return []
+    return [(turn.role, turn.tool_name) for turn in context.turns]
+
+
 def test_cross_subprocess_persistence():
     """
     Test that conversation threads persist across subprocess calls
@@ -20,165 +47,80 @@ def test_cross_subprocess_persistence():
     """
     print("🧪 Testing cross-subprocess conversation persistence...")
     print(f"Using storage backend: {os.getenv('STORAGE_BACKEND', 'file')}")
-    
-    # Test 1: Create a thread in subprocess 1
-    print("\n📝 Step 1: Creating conversation thread in subprocess...")
-    result1 = subprocess.run([
-        sys.executable, "-c", """
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path.cwd()))
 
-from utils.conversation_memory import create_thread, add_turn
+    # Two long-lived spawn workers stand in for two independent agent processes.
+    # Each pays interpreter startup + imports once; both start in parallel.
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as first, ctx.Pool(1) as second:
+        # Test 1: Create a thread in subprocess 1
+        print("\n📝 Step 1: Creating conversation thread in subprocess...")
+        try:
+            thread_id, add_success = first.apply(create_thread_worker)
+        except Exception as e:
+            print(f"❌ Subprocess 1 failed: {e}")
+            return False
 
-# Create thread with some data
-thread_id = create_thread('test_tool', {'test': 'data'})
-success = add_turn(thread_id, 'user', 'Test message from subprocess 1', tool_name='test_tool')
+        if not thread_id or not add_success:
+            print(f"❌ Failed to create thread: {thread_id!r} (add_turn={add_success})")
+            return False
 
-print(f'THREAD_ID:{thread_id}')
-print(f'ADD_SUCCESS:{success}')
-"""
-    ], capture_output=True, text=True)
-    
-    if result1.returncode != 0:
-        print(f"❌ Subprocess 1 failed: {result1.stderr}")
-        return False
-    
-    # Extract thread ID from output
-    lines = result1.stdout.strip().split('\n')
-    thread_id = None
-    add_success = None
-    
-    for line in lines:
-        if line.startswith('THREAD_ID:'):
-            thread_id = line.split(':', 1)[1]
-        elif line.startswith('ADD_SUCCESS:'):
-            add_success = line.split(':', 1)[1] == 'True'
-    
-    if not thread_id or not add_success:
-        print(f"❌ Failed to create thread: {result1.stdout}")
-        return False
-    
-    print(f"✅ Thread created: {thread_id}")
-    
-    # Small delay to ensure file is written
-    time.sleep(0.1)
-    
-    # Test 2: Retrieve thread in subprocess 2 (different process)
-    print("\n🔍 Step 2: Retrieving thread from different subprocess...")
-    result2 = subprocess.run([
-        sys.executable, "-c", f"""
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path.cwd()))
+        print(f"✅ Thread created: {thread_id}")
 
-from utils.conversation_memory import get_thread, add_turn
+        # No delay needed: apply() returns only after the worker's write has
+        # completed, and a finished write is visible to every other process.
 
-# Try to get the thread created in subprocess 1
-thread_id = '{thread_id}'
-context = get_thread(thread_id)
+        # Test 2: Retrieve thread in subprocess 2 (different process)
+        print("\n🔍 Step 2: Retrieving thread from different subprocess...")
+        try:
+            thread_found, _tool_name, turns_count, add_turn_success = second.apply(
+                continue_thread_worker, (thread_id,)
+            )
+        except Exception as e:
+            print(f"❌ Subprocess 2 failed: {e}")
+            return False
 
-if context:
-    print('THREAD_FOUND:True')
-    print(f'THREAD_TOOL:{{context.tool_name}}')
-    print(f'THREAD_TURNS:{{len(context.turns)}}')
-    
-    # Add another turn to verify it works
-    success = add_turn(thread_id, 'assistant', 'Response from subprocess 2', tool_name='test_tool')
-    print(f'ADD_TURN_SUCCESS:{{success}}')
-else:
-    print('THREAD_FOUND:False')
-"""
-    ], capture_output=True, text=True)
-    
-    if result2.returncode != 0:
-        print(f"❌ Subprocess 2 failed: {result2.stderr}")
-        return False
-    
-    # Parse results
-    lines2 = result2.stdout.strip().split('\n')
-    thread_found = False
-    turns_count = 0
-    add_turn_success = False
-    
-    for line in lines2:
-        if line.startswith('THREAD_FOUND:'):
-            thread_found = line.split(':', 1)[1] == 'True'
-        elif line.startswith('THREAD_TURNS:'):
-            turns_count = int(line.split(':', 1)[1])
-        elif line.startswith('ADD_TURN_SUCCESS:'):
-            add_turn_success = line.split(':', 1)[1] == 'True'
-    
-    if not thread_found:
-        print("❌ Thread not found in subprocess 2 - FileStorage persistence failed!")
-        print(f"Subprocess 2 output: {result2.stdout}")
-        return False
-    
-    print(f"✅ Thread retrieved successfully: {turns_count} turn(s)")
-    
-    if not add_turn_success:
-        print("❌ Failed to add turn in subprocess 2")
-        return False
-    
-    print("✅ Successfully added turn from subprocess 2")
-    
-    # Test 3: Verify both turns exist in subprocess 3
-    print("\n🔄 Step 3: Verifying complete conversation in subprocess 3...")
-    result3 = subprocess.run([
-        sys.executable, "-c", f"""
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path.cwd()))
+        if not thread_found:
+            print("❌ Thread not found in subprocess 2 - FileStorage persistence failed!")
+            return False
 
-from utils.conversation_memory import get_thread
+        print(f"✅ Thread retrieved successfully: {turns_count} turn(s)")
 
-thread_id = '{thread_id}'
-context = get_thread(thread_id)
+        if not add_turn_success:
+            print("❌ Failed to add turn in subprocess 2")
+            return False
 
-if context:
-    print(f'FINAL_TURNS:{{len(context.turns)}}')
-    for i, turn in enumerate(context.turns):
-        print(f'TURN_{{i}}_ROLE:{{turn.role}}')
-        print(f'TURN_{{i}}_TOOL:{{turn.tool_name}}')
-else:
-    print('FINAL_TURNS:0')
-"""
-    ], capture_output=True, text=True)
-    
-    if result3.returncode != 0:
-        print(f"❌ Subprocess 3 failed: {result3.stderr}")
-        return False
-    
-    # Parse final results
-    lines3 = result3.stdout.strip().split('\n')
-    final_turns = 0
-    
-    for line in lines3:
-        if line.startswith('FINAL_TURNS:'):
-            final_turns = int(line.split(':', 1)[1])
-            break
-    
+        print("✅ Successfully added turn from subprocess 2")
+
+        # Test 3: Verify both turns from subprocess 1, which did not write the second turn
+        print("\n🔄 Step 3: Verifying complete conversation in subprocess 1...")
+        try:
+            turns = first.apply(verify_thread_worker, (thread_id,))
+        except Exception as e:
+            print(f"❌ Subprocess 1 verification failed: {e}")
+            return False
+
+    final_turns = len(turns)
     if final_turns < 2:
         print(f"❌ Expected 2+ turns, found {final_turns}")
-        print(f"Subprocess 3 output: {result3.stdout}")
+        print(f"Turns seen by subprocess 1: {turns}")
         return False
-    
+
     print(f"✅ Complete conversation preserved: {final_turns} turns across multiple subprocesses")
-    
+
     return True
 
 def check_storage_directory():
-    """Check if the storage directory exists and has files"""
+    """Check if the storage directory exists and holds thread records (one .meta file each)"""
     # Match the same logic as FileStorage class
     default_dir = os.path.expanduser("~/.zen_mcp/threads")
     storage_dir = os.getenv("ZEN_MCP_STORAGE_DIR", default_dir)
     storage_path = Path(storage_dir)
     
     if storage_path.exists():
-        json_files = list(storage_path.glob("*.json"))
+        meta_files = list(storage_path.glob("*/*.meta"))
         print(f"\n📁 Storage directory: {storage_path}")
-        print(f"📄 Thread files found: {len(json_files)}")
-        return len(json_files) > 0
+        print(f"📄 Thread records (.meta) found: {len(meta_files)}")
+        return len(meta_files) > 0
     else:
         print(f"\n📁 Storage directory does not exist: {storage_path}")
         return False
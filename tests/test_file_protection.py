@@ -242,6 +242,24 @@ class TestExcludedDirectories:
         assert "index.js" in file_names
         assert "generated.js" not in file_names
 
+    def test_glob_excluded_directories(self, tmp_path):
+        """Test that glob entries like *.egg-info match real directory names."""
+        project = tmp_path / "pkg"
+        project.mkdir()
+
+        excluded_dir = project / "mypackage.egg-info"
+        excluded_dir.mkdir()
+        (excluded_dir / "metadata.py").write_text("# Generated")
+
+        (project / "setup.py").write_text("# Setup")
+
+        files = expand_paths([str(project)])
+
+        file_names = [Path(f).name for f in files]
+
+        assert "setup.py" in file_names
+        assert "metadata.py" not in file_names
+
 
 class TestIntegrationScenarios:
     """Test realistic integration scenarios."""
@@ -15,7 +15,12 @@ import unittest
 from pathlib import Path
 from unittest.mock import patch
 
-from utils.storage_backend import FileStorage, get_storage_backend
+from utils.storage_backend import (
+    FileStorage,
+    InMemoryStorage,
+    _cleanup_scheduler,
+    get_storage_backend,
+)
 
 
 class TestFileStorage(unittest.TestCase):
@@ -32,6 +37,11 @@ class TestFileStorage(unittest.TestCase):
         self.storage.shutdown()
         shutil.rmtree(self.temp_dir, ignore_errors=True)
 
+    def _value_file(self, key):
+        """Path of the value file the current metadata of ``key`` refers to"""
+        meta_path = self.storage._get_file_path(key)
+        return meta_path.with_name(json.loads(meta_path.read_bytes())["value_file"])
+
     def test_set_get_value(self):
         """Test basic set/get functionality"""
         key = "test_key"
@@ -96,7 +106,61 @@ class TestFileStorage(unittest.TestCase):
         self.assertEqual(len(results), num_threads)
         for thread_id, retrieved in results:
             self.assertEqual(retrieved, f"value_{thread_id}")
-    
+
+    def test_interleaved_writers_agree(self):
+        """Test that writers racing on one key leave a consistent record that every reader agrees on"""
+        key = "raced_key"
+        other = FileStorage(storage_dir=self.temp_dir)
+        original_write = self.storage._write_atomic
+
+        def write_then_race(file_path, payload):
+            signature = original_write(file_path, payload)
+            if file_path.suffix == ".bin" and payload == b"from A":
+                # B writes its whole record between A's value and A's metadata
+                other.setex(key, 3600, "from B")
+            return signature
+
+        with patch.object(self.storage, "_write_atomic", side_effect=write_then_race):
+            self.storage.setex(key, 3600, "from A")
+
+        # A's metadata landed last, so A's value wins everywhere
+        fresh = FileStorage(storage_dir=self.temp_dir)
+        self.assertEqual(fresh.get(key), "from A")
+        self.assertEqual(self.storage.get(key), "from A")
+        self.assertEqual(other.get(key), "from A")
+
+        # And the same holds the other way round
+        other.setex(key, 3600, "from B again")
+        self.assertEqual(self.storage.get(key), "from B again")
+        self.assertEqual(fresh.get(key), "from B again")
+        for storage in (other, fresh):
+            storage.shutdown()
+
+    def test_concurrent_writers_one_key(self):
+        """Test that readers only ever see complete values while threads rewrite one key"""
+        key = "contended_key"
+        writers = [FileStorage(storage_dir=self.temp_dir) for _ in range(4)]
+        values = {f"writer {i} turn {turn}" * 50 for i in range(len(writers)) for turn in range(20)}
+        seen = set()
+
+        def write(index, storage):
+            for turn in range(20):
+                storage.setex(key, 3600, f"writer {index} turn {turn}" * 50)
+                seen.add(storage.get(key))
+
+        threads = [threading.Thread(target=write, args=(i, s)) for i, s in enumerate(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(seen, values)
+        final = {storage.get(key) for storage in writers}
+        final.add(FileStorage(storage_dir=self.temp_dir).get(key))
+        self.assertEqual(len(final), 1)
+        for storage in writers:
+            storage.shutdown()
+
     def test_key_sanitization(self):
         """Test that unsafe keys are sanitized for filesystem"""
         unsafe_key = "thread:12345-abcd/special"
@@ -108,9 +172,15 @@ class TestFileStorage(unittest.TestCase):
         
         self.assertEqual(retrieved, value)
         
-        # Check that file was created with sanitized name
-        expected_file = self.storage.storage_path / "thread_12345-abcd_special.json"
-        self.assertTrue(expected_file.exists())
+        # Check that the file was created under a fixed-length hashed name in its shard
+        file_path = self.storage._get_file_path(unsafe_key)
+        self.assertTrue(file_path.exists())
+        self.assertEqual(file_path.parent.parent, self.storage.storage_path)
+        self.assertEqual(file_path.parent.name, file_path.name[:2])
+        self.assertEqual(len(file_path.stem), 32)
+
+        # The original key is kept in the record for debugging
+        self.assertEqual(json.loads(file_path.read_bytes())["key"], unsafe_key)
     
     def test_corrupted_file_handling(self):
         """Test handling of corrupted JSON files"""
@@ -118,6 +188,7 @@ class TestFileStorage(unittest.TestCase):
         file_path = self.storage._get_file_path(key)
         
         # Create a corrupted JSON file
+        file_path.parent.mkdir(parents=True, exist_ok=True)
         with open(file_path, 'w') as f:
             f.write("invalid json {{{")
         
@@ -149,17 +220,319 @@ class TestFileStorage(unittest.TestCase):
         self.assertTrue(valid_file.exists())
         self.assertEqual(self.storage.get(valid_key), "valid_value")
 
+    def test_cleanup_decides_from_stat_alone(self):
+        """Test that cleanup does not open records this instance already indexed"""
+        self.storage.setex("expired_key", -1, "expired_value")
+        self.storage.setex("valid_key", 3600, "valid_value")
+
+        with patch.object(self.storage, "_read_record") as mock_read:
+            self.storage._cleanup_expired()
+            mock_read.assert_not_called()
+
+        self.assertFalse(self.storage._get_file_path("expired_key").exists())
+        self.assertTrue(self.storage._get_file_path("valid_key").exists())
+
+    def test_cleanup_sees_files_from_other_writers(self):
+        """Test that cleanup handles records written or rewritten by another process"""
+        other = FileStorage(storage_dir=self.temp_dir)
+        try:
+            other.setex("foreign_expired", 1, "gone")
+            self.storage.setex("extended", 1, "short")
+            # Another process extends the record after this instance indexed it
+            other.setex("extended", 3600, "long")
+        finally:
+            other.shutdown()
+
+        time.sleep(1.5)
+        self.storage._cleanup_expired()
+
+        self.assertFalse(self.storage._get_file_path("foreign_expired").exists())
+        self.assertEqual(self.storage.get("extended"), "long")
+
+    def test_cleanup_removes_orphaned_values(self):
+        """Test that value files no metadata refers to are eventually removed"""
+        self.storage.setex("live_key", 3600, "superseded")
+        superseded = self._value_file("live_key")
+        self.storage.setex("live_key", 3600, "live")
+        live_value = self._value_file("live_key")
+        orphan = live_value.parent / "orphan.bin"
+        orphan.write_bytes(b"left behind")
+        in_flight = live_value.parent / "in_flight.bin"
+        in_flight.write_bytes(b"metadata not written yet")
+        old = time.time() - self.storage._cleanup_interval - 10
+        for path in (superseded, live_value, orphan):
+            os.utime(path, (old, old))
+
+        # A fresh instance has to learn the live value file from disk
+        other = FileStorage(storage_dir=self.temp_dir)
+        other._cleanup_expired()
+        other.shutdown()
+
+        self.assertFalse(superseded.exists())
+        self.assertFalse(orphan.exists())
+        self.assertTrue(live_value.exists())
+        self.assertTrue(in_flight.exists())
+        self.assertEqual(self.storage.get("live_key"), "live")
+
+    def test_cleanup_expires_unsharded_legacy_files(self):
+        """Test that records written before key sharding still expire"""
+        legacy = self.storage.storage_path / "thread_legacy.json"
+        legacy.write_bytes(json.dumps({"value": "old", "expires_at": time.time() - 1}).encode())
+
+        self.storage._cleanup_expired()
+
+        self.assertFalse(legacy.exists())
+
+    def test_legacy_records_stay_readable(self):
+        """Test that records from the single-file layout are read until the thread is rewritten"""
+        flat_key, expired_key = "thread:flat", "thread:expired"
+        flat = self.storage.storage_path / "thread_flat.json"
+        expired = self.storage.storage_path / "thread_expired.json"
+        flat.write_bytes(json.dumps({"value": "flat", "expires_at": time.time() + 3600}).encode())
+        expired.write_bytes(json.dumps({"value": "stale", "expires_at": time.time() - 1}).encode())
+
+        self.assertEqual(self.storage.get(flat_key), "flat")
+        self.assertIsNone(self.storage.get(expired_key))
+        self.assertFalse(expired.exists())
+
+        # Writing the thread again moves it to the current layout
+        self.storage.setex(flat_key, 3600, "rewritten")
+        self.assertEqual(self.storage.get(flat_key), "rewritten")
+        self.assertIsNone(self.storage.get("thread:missing"))
+
+    def test_read_cache_revalidates_against_file(self):
+        """Test that repeated reads are served from memory until the file changes"""
+        key = "cached_key"
+        self.storage.setex(key, 3600, "first")
+        self.assertEqual(self.storage.get(key), "first")
+
+        with patch.object(self.storage, "_read_record", wraps=self.storage._read_record) as mock_read:
+            self.assertEqual(self.storage.get(key), "first")
+            mock_read.assert_not_called()
+
+            # A write from another process replaces the file and invalidates the entry
+            other = FileStorage(storage_dir=self.temp_dir)
+            other.setex(key, 3600, "second")
+            other.shutdown()
+            self.assertEqual(self.storage.get(key), "second")
+            mock_read.assert_called_once()
+
+            # A removed file is never served from the cache
+            self.storage._get_file_path(key).unlink()
+            self.assertIsNone(self.storage.get(key))
+
+    def test_fsync_is_opt_in(self):
+        """Test that writes only fsync when ZEN_MCP_FSYNC is enabled"""
+        with patch("utils.storage_backend.os.fsync") as mock_fsync:
+            self.storage.setex("no_fsync", 3600, "value")
+            mock_fsync.assert_not_called()
+
+        with patch.dict(os.environ, {"ZEN_MCP_FSYNC": "true"}):
+            durable = FileStorage(storage_dir=self.temp_dir)
+        with patch("utils.storage_backend.os.fsync") as mock_fsync:
+            durable.setex("fsync", 3600, "value")
+            mock_fsync.assert_called()
+        durable.shutdown()
+
+    def test_fsync_syncs_directory_after_rename(self):
+        """Test that a durable write outside a batch also syncs its directory once the file is in place"""
+        with patch.dict(os.environ, {"ZEN_MCP_FSYNC": "true"}):
+            durable = FileStorage(storage_dir=self.temp_dir)
+        shard = durable._get_file_path("dir_sync").parent
+        synced = []
+
+        def record(directory):
+            synced.append((directory, sorted(p.suffix for p in directory.iterdir())))
+
+        with patch("utils.storage_backend._fsync_directory", side_effect=record):
+            durable.setex("dir_sync", 3600, "value")
+        durable.shutdown()
+
+        # Once after the value file is renamed into place, once after the metadata
+        self.assertEqual(synced, [(shard, [".bin"]), (shard, [".bin", ".meta"])])
+
+    def test_write_batch_groups_fsyncs(self):
+        """Test that a batch applies writes immediately but syncs each file once at the end"""
+        with patch.dict(os.environ, {"ZEN_MCP_FSYNC": "true"}):
+            durable = FileStorage(storage_dir=self.temp_dir)
+        with patch("utils.storage_backend.os.fsync") as mock_fsync:
+            with durable.write_batch():
+                for turn in range(5):
+                    durable.setex("batched", 3600, f"turn {turn}")
+                durable.setex("other", 3600, "value")
+                # Visible to other processes before the batch ends
+                self.assertEqual(FileStorage(storage_dir=self.temp_dir).get("batched"), "turn 4")
+                mock_fsync.assert_not_called()
+
+            # One value file per write, one metadata file per key, plus their shard directories
+            shards = {durable._get_file_path(k).parent for k in ("batched", "other")}
+            self.assertEqual(mock_fsync.call_count, 6 + 2 + len(shards))
+        durable.shutdown()
+
+    def test_stdlib_json_fallback(self):
+        """Test that records round-trip compactly and unescaped when orjson is unavailable"""
+        key = "thread:café"
+        value = '{"turn": "naïve \\"quote\\""}'
+
+        with patch("utils.storage_backend.orjson", None):
+            self.storage.setex(key, 3600, value)
+            meta_bytes = self.storage._get_file_path(key).read_bytes()
+            fresh = FileStorage(storage_dir=self.temp_dir)
+            self.assertEqual(fresh.get(key), value)
+            fresh.shutdown()
+
+        # Compact separators, and non-ASCII written as UTF-8 rather than \uXXXX escapes
+        self.assertNotIn(b", ", meta_bytes)
+        self.assertNotIn(b": ", meta_bytes)
+        self.assertIn("café".encode(), meta_bytes)
+        self.assertEqual(json.loads(meta_bytes)["key"], key)
+
+    def test_overwrite_is_atomic(self):
+        """Test that rewriting a key replaces the file without leaving temp files behind"""
+        key = "atomic_key"
+
+        self.storage.setex(key, 3600, "first")
+        self.storage.setex(key, 3600, "second")
+
+        self.assertEqual(self.storage.get(key), "second")
+        file_path = self.storage._get_file_path(key)
+        # The superseded value file stays until cleanup collects it
+        remaining = set(file_path.parent.iterdir())
+        self.assertEqual(len(remaining), 3)
+        self.assertIn(self._value_file(key), remaining)
+        self.assertFalse([p for p in remaining if ".tmp." in p.name])
+
+    def test_value_stored_as_raw_bytes(self):
+        """Test that values are stored verbatim next to a small metadata file"""
+        key = "raw_key"
+        value = '{"turns": ["quoted \\"text\\"", "café"]}'
+
+        self.storage.setex(key, 3600, value)
+
+        meta_path = self.storage._get_file_path(key)
+        self.assertEqual(self._value_file(key).read_bytes(), value.encode("utf-8"))
+        self.assertNotIn("value", json.loads(meta_path.read_bytes()))
+
+        # A fresh instance (no read cache) decodes the same value
+        other = FileStorage(storage_dir=self.temp_dir)
+        self.assertEqual(other.get(key), value)
+        other.shutdown()
+
+    def test_cleanup_removes_stale_temp_files(self):
+        """Test that temp files abandoned by a crashed writer are eventually removed"""
+        stale = self.storage.storage_path / "crashed.json.tmp.1234.5678"
+        fresh = self.storage.storage_path / "inflight.json.tmp.1234.5679"
+        stale.write_bytes(b"{")
+        fresh.write_bytes(b"{")
+        old = time.time() - self.storage._cleanup_interval - 10
+        os.utime(stale, (old, old))
+
+        self.storage._cleanup_expired()
+
+        self.assertFalse(stale.exists())
+        self.assertTrue(fresh.exists())
+
+
+class TestInMemoryStorage(unittest.TestCase):
+    """Test InMemoryStorage expiration handling"""
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+
+    def tearDown(self):
+        self.storage.shutdown()
+
+    def test_cleanup_skips_superseded_expirations(self):
+        """Test that cleanup removes expired keys but not keys rewritten with a later expiry"""
+        self.storage.setex("expired", -1, "old")
+        self.storage.setex("valid", 3600, "kept")
+        self.storage.setex("rewritten", -1, "old")
+        self.storage.setex("rewritten", 3600, "new")
+
+        self.storage._cleanup_expired()
+
+        self.assertEqual(set(self.storage._store), {"valid", "rewritten"})
+        self.assertEqual(self.storage.get("rewritten"), "new")
+
+
+class TestCleanupScheduler(unittest.TestCase):
+    """Test the cleanup scheduler shared by all storage backends"""
+
+    class _Counter:
+        def __init__(self):
+            self.calls = threading.Semaphore(0)
+
+        def cleanup(self):
+            self.calls.release()
+
+    def test_runs_until_cancelled(self):
+        """Test that a scheduled cleanup repeats and stops once cancelled"""
+        counter = self._Counter()
+        task = _cleanup_scheduler.schedule(counter.cleanup, 0.01)
+        self.assertTrue(counter.calls.acquire(timeout=2))
+        self.assertTrue(counter.calls.acquire(timeout=2))
+
+        task.cancel()
+        time.sleep(0.05)  # Let an already queued run drain
+        while counter.calls.acquire(blocking=False):
+            pass
+        time.sleep(0.05)
+        self.assertFalse(counter.calls.acquire(blocking=False))
+
+    def test_shutdown_cancels_backend_cleanup(self):
+        """Test that shutdown() stops the backend's own cleanup and nothing else"""
+        running = InMemoryStorage()
+        stopped = InMemoryStorage()
+        for storage in (running, stopped):
+            storage.setex("expired", -1, "old")
+
+        stopped.shutdown()
+        self.assertTrue(stopped._cleanup_task.cancelled)
+        self.assertFalse(running._cleanup_task.cancelled)
+
+        # Run both tasks as the scheduler thread would when they come due
+        _cleanup_scheduler._run_task(stopped._cleanup_task)
+        _cleanup_scheduler._run_task(running._cleanup_task)
+        self.assertIn("expired", stopped._store)
+        self.assertNotIn("expired", running._store)
+        running.shutdown()
+
+    def test_backends_share_one_thread(self):
+        """Test that creating backends does not start a thread per instance"""
+        first = InMemoryStorage()
+        threads_before = threading.active_count()
+        second = InMemoryStorage()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            third = FileStorage(storage_dir=temp_dir)
+            self.assertEqual(threading.active_count(), threads_before)
+            third.shutdown()
+        first.shutdown()
+        second.shutdown()
+
+
+# Per-worker FileStorage instances, so a pool worker servicing several
+# operations only constructs one storage per directory
+_STORAGE_CACHE: dict[str, FileStorage] = {}
+
+
+def _worker_storage(storage_dir):
+    """Return the cached FileStorage for storage_dir in this process"""
+    storage = _STORAGE_CACHE.get(storage_dir)
+    if storage is None:
+        storage = _STORAGE_CACHE[storage_dir] = FileStorage(storage_dir=storage_dir)
+    return storage
+
 
 def cross_process_write_subprocess(storage_dir, key, value, ttl):
     """Helper function for cross-process test - write operation"""
-    storage = FileStorage(storage_dir=storage_dir)
+    storage = _worker_storage(storage_dir)
     storage.setex(key, ttl, value)
     return True
 
 
 def cross_process_read_subprocess(storage_dir, key):
     """Helper function for cross-process test - read operation"""
-    storage = FileStorage(storage_dir=storage_dir)
+    storage = _worker_storage(storage_dir)
     return storage.get(key)
 
 
@@ -167,12 +540,20 @@ class TestCrossProcessPersistence(unittest.TestCase):
     """Test the critical cross-process persistence functionality"""
 
     def setUp(self):
-        """Set up test environment with temporary directory"""
+        """Set up test environment with temporary directory and worker pools"""
         self.temp_dir = tempfile.mkdtemp(prefix="zen_mcp_cross_process_")
+        # Two long-lived single-worker pools stand in for two separate agent
+        # subprocesses; alternating between them keeps every read in a
+        # different process from the preceding write.
+        self.writer_pool = multiprocessing.Pool(1)
+        self.reader_pool = multiprocessing.Pool(1)
     
     def tearDown(self):
-        """Clean up test environment"""
+        """Clean up worker pools and test environment"""
         import shutil
+        for pool in (self.writer_pool, self.reader_pool):
+            pool.close()
+            pool.join()
         shutil.rmtree(self.temp_dir, ignore_errors=True)
 
     def test_cross_process_persistence(self):
@@ -187,20 +568,18 @@ class TestCrossProcessPersistence(unittest.TestCase):
         ttl = 3600
         
         # Write in subprocess (simulates first Agent Zero subprocess call)
-        with multiprocessing.Pool(1) as pool:
-            write_result = pool.apply(
-                cross_process_write_subprocess, 
-                (self.temp_dir, key, value, ttl)
-            )
-            self.assertTrue(write_result)
+        write_result = self.writer_pool.apply(
+            cross_process_write_subprocess, 
+            (self.temp_dir, key, value, ttl)
+        )
+        self.assertTrue(write_result)
         
         # Read in different subprocess (simulates second Agent Zero subprocess call)
-        with multiprocessing.Pool(1) as pool:
-            read_result = pool.apply(
-                cross_process_read_subprocess,
-                (self.temp_dir, key)
-            )
-            self.assertEqual(read_result, value)
+        read_result = self.reader_pool.apply(
+            cross_process_read_subprocess,
+            (self.temp_dir, key)
+        )
+        self.assertEqual(read_result, value)
     
     def test_multiple_subprocess_conversation_flow(self):
         """
@@ -208,10 +587,9 @@ class TestCrossProcessPersistence(unittest.TestCase):
         
         Simulates the exact Agent Zero/Claude usage pattern:
         1. Subprocess 1: Creates conversation thread
-        2. Subprocess 1 dies
-        3. Subprocess 2: Continues conversation with continuation_id
-        4. Subprocess 2 dies  
-        5. Subprocess 3: Continues conversation again
+        2. Subprocess 2: Continues conversation with continuation_id
+        3. Subprocess 2: Stores the updated conversation
+        4. Subprocess 1: Continues conversation again and sees the update
         """
         thread_id = "thread:abcd-1234-efgh-5678"
         
@@ -222,22 +600,20 @@ class TestCrossProcessPersistence(unittest.TestCase):
             "created_at": "2023-01-01T00:00:00Z"
         })
         
-        with multiprocessing.Pool(1) as pool:
-            pool.apply(
-                cross_process_write_subprocess,
-                (self.temp_dir, f"thread:{thread_id}", conversation_data, 10800)  # 3 hours
-            )
+        self.writer_pool.apply(
+            cross_process_write_subprocess,
+            (self.temp_dir, f"thread:{thread_id}", conversation_data, 10800)  # 3 hours
+        )
         
         # Simulate second subprocess call (continuation)
-        with multiprocessing.Pool(1) as pool:
-            retrieved_data = pool.apply(
-                cross_process_read_subprocess,
-                (self.temp_dir, f"thread:{thread_id}")
-            )
-            self.assertIsNotNone(retrieved_data)
-            parsed_data = json.loads(retrieved_data)
-            self.assertEqual(parsed_data["thread_id"], thread_id)
-            self.assertEqual(len(parsed_data["turns"]), 1)
+        retrieved_data = self.reader_pool.apply(
+            cross_process_read_subprocess,
+            (self.temp_dir, f"thread:{thread_id}")
+        )
+        self.assertIsNotNone(retrieved_data)
+        parsed_data = json.loads(retrieved_data)
+        self.assertEqual(parsed_data["thread_id"], thread_id)
+        self.assertEqual(len(parsed_data["turns"]), 1)
         
         # Update conversation in second subprocess
         updated_data = json.dumps({
@@ -249,22 +625,20 @@ class TestCrossProcessPersistence(unittest.TestCase):
             "created_at": "2023-01-01T00:00:00Z"
         })
         
-        with multiprocessing.Pool(1) as pool:
-            pool.apply(
-                cross_process_write_subprocess,
-                (self.temp_dir, f"thread:{thread_id}", updated_data, 10800)
-            )
-        
-        # Simulate third subprocess call (another continuation)
-        with multiprocessing.Pool(1) as pool:
-            final_data = pool.apply(
-                cross_process_read_subprocess,
-                (self.temp_dir, f"thread:{thread_id}")
-            )
-            self.assertIsNotNone(final_data)
-            parsed_final = json.loads(final_data)
-            self.assertEqual(len(parsed_final["turns"]), 2)
-            self.assertEqual(parsed_final["turns"][1]["content"], "Hi there!")
+        self.reader_pool.apply(
+            cross_process_write_subprocess,
+            (self.temp_dir, f"thread:{thread_id}", updated_data, 10800)
+        )
+        
+        # Simulate another continuation back in the first subprocess
+        final_data = self.writer_pool.apply(
+            cross_process_read_subprocess,
+            (self.temp_dir, f"thread:{thread_id}")
+        )
+        self.assertIsNotNone(final_data)
+        parsed_final = json.loads(final_data)
+        self.assertEqual(len(parsed_final["turns"]), 2)
+        self.assertEqual(parsed_final["turns"][1]["content"], "Hi there!")
 
 
 class TestStorageBackendSelection(unittest.TestCase):
@@ -283,8 +657,6 @@ class TestStorageBackendSelection(unittest.TestCase):
     @patch.dict(os.environ, {"STORAGE_BACKEND": "memory"})
     def test_memory_backend_selection(self):
         """Test that STORAGE_BACKEND=memory selects InMemoryStorage"""
-        from utils.storage_backend import InMemoryStorage
-        
         backend = get_storage_backend()
         self.assertIsInstance(backend, InMemoryStorage)
 
@@ -10,7 +10,7 @@ endpoint-level limitation, not model-specific. These tests verify that:
 """
 
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, PropertyMock, patch
 
 from providers.openai_compatible import OpenAICompatibleProvider
 from providers.shared import ProviderType
@@ -63,43 +63,54 @@ class TestStoreParameterHandling(unittest.TestCase):
     **Feature: openrouter-store-parameter-fix, Property 2: Direct OpenAI requests include store parameter**
     """
 
-    def test_openrouter_responses_omits_store_parameter(self):
-        """Test that OpenRouter provider omits store parameter from responses endpoint.
+    @classmethod
+    def setUpClass(cls):
+        """Patch the provider client once for the whole class."""
+        cls._mock_client = Mock()
+        cls._client_patcher = patch.object(
+            OpenAICompatibleProvider, "client", new_callable=PropertyMock, return_value=cls._mock_client
+        )
+        cls._client_patcher.start()
 
-        **Feature: openrouter-store-parameter-fix, Property 1: OpenRouter requests omit store parameter**
-        **Validates: Requirements 1.1, 2.1**
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the class-wide provider client patch."""
+        cls._client_patcher.stop()
 
-        OpenRouter's /responses endpoint rejects store:true via Zod validation (Issue #348).
-        The store parameter should be omitted entirely for OpenRouter requests.
-        """
-        # Capture the completion_params passed to the API
-        captured_params = {}
+    def setUp(self):
+        """Capture the completion_params passed to the API with a fresh dict per test."""
+        self.captured_params = {}
 
         def capture_create(**kwargs):
-            captured_params.update(kwargs)
+            self.captured_params.update(kwargs)
             # Return a mock response
             mock_response = Mock()
             mock_response.output_text = "Test response"
             mock_response.usage = None
             return mock_response
 
-        mock_client_instance = Mock()
-        mock_client_instance.responses.create = capture_create
+        self._mock_client.responses.create = capture_create
 
-        with patch.object(
-            MockOpenRouterProvider, "client", new_callable=lambda: property(lambda self: mock_client_instance)
-        ):
-            provider = MockOpenRouterProvider("test-key")
+    def test_openrouter_responses_omits_store_parameter(self):
+        """Test that OpenRouter provider omits store parameter from responses endpoint.
 
-            # Call the method that builds completion_params
-            provider._generate_with_responses_endpoint(
-                model_name="openai/gpt-5-pro",
-                messages=[{"role": "user", "content": "test"}],
-                temperature=0.7,
-            )
+        **Feature: openrouter-store-parameter-fix, Property 1: OpenRouter requests omit store parameter**
+        **Validates: Requirements 1.1, 2.1**
+
+        OpenRouter's /responses endpoint rejects store:true via Zod validation (Issue #348).
+        The store parameter should be omitted entirely for OpenRouter requests.
+        """
+        provider = MockOpenRouterProvider("test-key")
+
+        # Call the method that builds completion_params
+        provider._generate_with_responses_endpoint(
+            model_name="openai/gpt-5-pro",
+            messages=[{"role": "user", "content": "test"}],
+            temperature=0.7,
+        )
 
         # Verify store parameter is NOT in the request
-        self.assertNotIn("store", captured_params, "OpenRouter requests should NOT include 'store' parameter")
+        self.assertNotIn("store", self.captured_params, "OpenRouter requests should NOT include 'store' parameter")
 
     def test_openai_responses_includes_store_parameter(self):
         """Test that direct OpenAI provider includes store parameter in responses endpoint.
@@ -110,35 +121,18 @@ class TestStoreParameterHandling(unittest.TestCase):
         Direct OpenAI API supports the store parameter for stored completions.
         The store parameter should be included with value True for OpenAI requests.
         """
-        # Capture the completion_params passed to the API
-        captured_params = {}
-
-        def capture_create(**kwargs):
-            captured_params.update(kwargs)
-            # Return a mock response
-            mock_response = Mock()
-            mock_response.output_text = "Test response"
-            mock_response.usage = None
-            return mock_response
-
-        mock_client_instance = Mock()
-        mock_client_instance.responses.create = capture_create
-
-        with patch.object(
-            MockOpenAIProvider, "client", new_callable=lambda: property(lambda self: mock_client_instance)
-        ):
-            provider = MockOpenAIProvider("test-key")
+        provider = MockOpenAIProvider("test-key")
 
-            # Call the method that builds completion_params
-            provider._generate_with_responses_endpoint(
-                model_name="gpt-5-pro",
-                messages=[{"role": "user", "content": "test"}],
-                temperature=0.7,
-            )
+        # Call the method that builds completion_params
+        provider._generate_with_responses_endpoint(
+            model_name="gpt-5-pro",
+            messages=[{"role": "user", "content": "test"}],
+            temperature=0.7,
+        )
 
         # Verify store parameter IS in the request with value True
-        self.assertIn("store", captured_params, "OpenAI requests should include 'store' parameter")
-        self.assertTrue(captured_params["store"], "OpenAI requests should have store=True")
+        self.assertIn("store", self.captured_params, "OpenAI requests should include 'store' parameter")
+        self.assertTrue(self.captured_params["store"], "OpenAI requests should have store=True")
 
 
 if __name__ == "__main__":
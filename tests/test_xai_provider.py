@@ -1,12 +1,34 @@
 """Tests for X.AI provider implementation."""
 
 import os
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from providers.shared import ProviderType
-from providers.xai import XAIModelProvider
+from providers.xai import XAIModelProvider, _select_preferred
+from tools.models import ToolModelCategory
+
+
+def _completion_response(model: str) -> SimpleNamespace:
+    """Build a plain chat-completion response object (cheaper than a MagicMock tree)."""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Test response"), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        model=model,
+        id="test-id",
+        created=1234567890,
+    )
+
+
+@pytest.fixture(scope="class")
+def provider():
+    """Shared provider for tests that neither patch the environment nor the client.
+
+    Restrictions are looked up at call time, so sharing the instance is safe.
+    """
+    return XAIModelProvider("test-key")
 
 
 class TestXAIProvider:
@@ -40,10 +62,8 @@ class TestXAIProvider:
         assert provider.api_key == "test-key"
         assert provider.base_url == "https://custom.x.ai/v1"
 
-    def test_model_validation(self):
+    def test_model_validation(self, provider):
         """Test model name validation."""
-        provider = XAIModelProvider("test-key")
-
         # Test valid models
         assert provider.validate_model_name("grok-4") is True
         assert provider.validate_model_name("grok4") is True
@@ -51,9 +71,6 @@ class TestXAIProvider:
         assert provider.validate_model_name("grok-4.1-fast") is True
         assert provider.validate_model_name("grok-4.1-fast-reasoning") is True
         assert provider.validate_model_name("grok-4.1-fast-reasoning-latest") is True
-        assert provider.validate_model_name("grok-4.1-fast") is True
-        assert provider.validate_model_name("grok-4.1-fast-reasoning") is True
-        assert provider.validate_model_name("grok-4.1-fast-reasoning-latest") is True
 
         # Test invalid model
         assert provider.validate_model_name("invalid-model") is False
@@ -63,10 +80,8 @@ class TestXAIProvider:
         assert provider.validate_model_name("grok-3-fast") is False
         assert provider.validate_model_name("grokfast") is False
 
-    def test_resolve_model_name(self):
+    def test_resolve_model_name(self, provider):
         """Test model name resolution."""
-        provider = XAIModelProvider("test-key")
-
         # Test shorthand resolution
         assert provider._resolve_model_name("grok") == "grok-4"
         assert provider._resolve_model_name("grok4") == "grok-4"
@@ -77,10 +92,8 @@ class TestXAIProvider:
         assert provider._resolve_model_name("grok-4") == "grok-4"
         assert provider._resolve_model_name("grok-4.1-fast") == "grok-4-1-fast-reasoning"
 
-    def test_get_capabilities_grok4(self):
+    def test_get_capabilities_grok4(self, provider):
         """Test getting model capabilities for GROK-4."""
-        provider = XAIModelProvider("test-key")
-
         capabilities = provider.get_capabilities("grok-4")
         assert capabilities.model_name == "grok-4"
         assert capabilities.friendly_name == "X.AI (Grok 4)"
@@ -98,10 +111,8 @@ class TestXAIProvider:
         assert capabilities.temperature_constraint.max_temp == 2.0
         assert capabilities.temperature_constraint.default_temp == 0.3
 
-    def test_get_capabilities_grok4_1_fast(self):
+    def test_get_capabilities_grok4_1_fast(self, provider):
         """Test getting model capabilities for GROK-4.1 Fast Reasoning."""
-        provider = XAIModelProvider("test-key")
-
         capabilities = provider.get_capabilities("grok-4.1-fast")
         assert capabilities.model_name == "grok-4-1-fast-reasoning"
         assert capabilities.friendly_name == "X.AI (Grok 4.1 Fast Reasoning)"
@@ -112,10 +123,8 @@ class TestXAIProvider:
         assert capabilities.supports_json_mode is True
         assert capabilities.supports_images is True
 
-    def test_get_capabilities_with_shorthand(self):
+    def test_get_capabilities_with_shorthand(self, provider):
         """Test getting model capabilities with shorthand."""
-        provider = XAIModelProvider("test-key")
-
         capabilities = provider.get_capabilities("grok")
         assert capabilities.model_name == "grok-4"  # Should resolve to full name
         assert capabilities.context_window == 256_000
@@ -123,17 +132,13 @@ class TestXAIProvider:
         capabilities_fast = provider.get_capabilities("grok-4.1-fast-reasoning")
         assert capabilities_fast.model_name == "grok-4-1-fast-reasoning"  # Should resolve to full name
 
-    def test_unsupported_model_capabilities(self):
+    def test_unsupported_model_capabilities(self, provider):
         """Test error handling for unsupported models."""
-        provider = XAIModelProvider("test-key")
-
         with pytest.raises(ValueError, match="Unsupported model 'invalid-model' for provider xai"):
             provider.get_capabilities("invalid-model")
 
-    def test_extended_thinking_flags(self):
+    def test_extended_thinking_flags(self, provider):
         """X.AI capabilities should expose extended thinking support correctly."""
-        provider = XAIModelProvider("test-key")
-
         thinking_aliases = [
             "grok-4",
             "grok",
@@ -145,9 +150,8 @@ class TestXAIProvider:
         for alias in thinking_aliases:
             assert provider.get_capabilities(alias).supports_extended_thinking is True
 
-    def test_provider_type(self):
+    def test_provider_type(self, provider):
         """Test provider type identification."""
-        provider = XAIModelProvider("test-key")
         assert provider.get_provider_type() == ProviderType.XAI
 
     @patch.dict(os.environ, {"XAI_ALLOWED_MODELS": "grok-4"})
@@ -223,18 +227,15 @@ class TestXAIProvider:
         assert provider.validate_model_name("grok") is True
         assert provider.validate_model_name("grok4") is True
 
-    def test_friendly_name(self):
+    def test_friendly_name(self, provider):
         """Test friendly name constant."""
-        provider = XAIModelProvider("test-key")
         assert provider.FRIENDLY_NAME == "X.AI"
 
         capabilities = provider.get_capabilities("grok-4")
         assert capabilities.friendly_name == "X.AI (Grok 4)"
 
-    def test_supported_models_structure(self):
+    def test_supported_models_structure(self, provider):
         """Test that MODEL_CAPABILITIES has the correct structure."""
-        provider = XAIModelProvider("test-key")
-
         # Check that all expected base models are present
         assert "grok-4" in provider.MODEL_CAPABILITIES
         assert "grok-4-1-fast-reasoning" in provider.MODEL_CAPABILITIES
@@ -273,17 +274,7 @@ class TestXAIProvider:
         mock_openai_class.return_value = mock_client
 
         # Mock the completion response
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = "Test response"
-        mock_response.choices[0].finish_reason = "stop"
-        mock_response.model = "grok-4"  # API returns the resolved model name
-        mock_response.id = "test-id"
-        mock_response.created = 1234567890
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 10
-        mock_response.usage.completion_tokens = 5
-        mock_response.usage.total_tokens = 15
+        mock_response = _completion_response(model="grok-4")  # API returns the resolved model name
 
         mock_client.chat.completions.create.return_value = mock_response
 
@@ -314,19 +305,10 @@ class TestXAIProvider:
     @patch("providers.openai_compatible.OpenAI")
     def test_generate_content_other_aliases(self, mock_openai_class):
         """Test other alias resolutions in generate_content."""
-        from unittest.mock import MagicMock
-
         # Set up mock
         mock_client = MagicMock()
         mock_openai_class.return_value = mock_client
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = "Test response"
-        mock_response.choices[0].finish_reason = "stop"
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 10
-        mock_response.usage.completion_tokens = 5
-        mock_response.usage.total_tokens = 15
+        mock_response = _completion_response(model="grok-4")
         mock_client.chat.completions.create.return_value = mock_response
 
         provider = XAIModelProvider("test-key")
@@ -352,3 +334,53 @@ class TestXAIProvider:
         provider.generate_content(prompt="Test", model_name="grok-4.1-fast", temperature=0.7)
         call_kwargs = mock_client.chat.completions.create.call_args[1]
         assert call_kwargs["model"] == "grok-4-1-fast-reasoning"
+
+
+class TestXAIPreferredModel:
+    """Test preferred-model selection and its memoization."""
+
+    def setup_method(self):
+        _select_preferred.cache_clear()
+
+    @pytest.mark.parametrize(
+        "allowed,expected",
+        [
+            pytest.param(["grok-4", "grok-4-1-fast-reasoning"], "grok-4-1-fast-reasoning", id="primary"),
+            pytest.param(["grok-3", "grok-4"], "grok-4", id="fallback"),
+            pytest.param(["grok-3-fast", "grok-3"], "grok-3-fast", id="first-allowed"),
+        ],
+    )
+    def test_selection_on_cache_miss_and_hit(self, provider, allowed, expected):
+        """Test that the same model is chosen whether or not the result is cached."""
+        assert provider.get_preferred_model(ToolModelCategory.BALANCED, allowed) == expected
+        info = _select_preferred.cache_info()
+        assert (info.hits, info.misses) == (0, 1)
+
+        assert provider.get_preferred_model(ToolModelCategory.EXTENDED_REASONING, list(allowed)) == expected
+        info = _select_preferred.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+
+    def test_empty_allowed_models(self, provider):
+        """Test that no model is preferred when none are allowed."""
+        assert provider.get_preferred_model(ToolModelCategory.BALANCED, []) is None
+
+    def test_patched_preference_is_honoured(self, provider):
+        """Test that patching PRIMARY_MODEL after a cached call changes the choice."""
+        allowed = ["grok-4", "grok-4-1-fast-reasoning"]
+        assert provider.get_preferred_model(ToolModelCategory.BALANCED, allowed) == "grok-4-1-fast-reasoning"
+
+        with patch.object(XAIModelProvider, "PRIMARY_MODEL", "grok-4"):
+            assert provider.get_preferred_model(ToolModelCategory.BALANCED, allowed) == "grok-4"
+
+    def test_subclass_preference_is_honoured(self):
+        """Test that subclasses overriding the preference order are not served the parent's result."""
+
+        class FallbackFirstProvider(XAIModelProvider):
+            PRIMARY_MODEL = "grok-4"
+            FALLBACK_MODEL = "grok-4-1-fast-reasoning"
+
+        allowed = ["grok-4-1-fast-reasoning", "grok-4"]
+        assert XAIModelProvider("test-key").get_preferred_model(ToolModelCategory.BALANCED, allowed) == (
+            "grok-4-1-fast-reasoning"
+        )
+        assert FallbackFirstProvider("test-key").get_preferred_model(ToolModelCategory.BALANCED, allowed) == "grok-4"
@@ -5,97 +5,245 @@ This module contains security-related constants and configurations
 for file access control.
 """
 
-from pathlib import Path
+import fnmatch
+import os
+import re
+import sys
+from collections.abc import Iterable
+from functools import lru_cache
+from pathlib import Path, PureWindowsPath
 
 # Dangerous system paths - block these AND all their subdirectories
 # These are system directories where user code should never reside
-DANGEROUS_SYSTEM_PATHS = {
-    "/",
-    "/etc",
-    "/usr",
-    "/bin",
-    "/var",
-    "/root",
-    "C:\\Windows",
-    "C:\\Program Files",
-}
+DANGEROUS_SYSTEM_PATHS = frozenset(
+    {
+        "/",
+        "/etc",
+        "/usr",
+        "/bin",
+        "/var",
+        "/root",
+        "C:\\Windows",
+        "C:\\Program Files",
+    }
+)
 
 # User home container paths - block ONLY the exact path, not subdirectories
 # Subdirectory access (e.g., /home/user/project) is controlled by is_home_directory_root()
 # This allows users to work in their home subdirectories while blocking overly broad access
-DANGEROUS_HOME_CONTAINERS = {
-    "/home",
-    "C:\\Users",
-}
+DANGEROUS_HOME_CONTAINERS = frozenset(
+    {
+        "/home",
+        "C:\\Users",
+    }
+)
 
 # Combined set for backward compatibility
 DANGEROUS_PATHS = DANGEROUS_SYSTEM_PATHS | DANGEROUS_HOME_CONTAINERS
 
 # Directories to exclude from recursive file search
 # These typically contain generated code, dependencies, or build artifacts
-EXCLUDED_DIRS = {
-    # Python
-    "__pycache__",
-    ".venv",
-    "venv",
-    "env",
-    ".env",
-    "*.egg-info",
-    ".eggs",
-    "wheels",
-    ".Python",
-    ".mypy_cache",
-    ".pytest_cache",
-    ".tox",
-    "htmlcov",
-    ".coverage",
-    "coverage",
-    # Node.js / JavaScript
-    "node_modules",
-    ".next",
-    ".nuxt",
-    "bower_components",
-    ".sass-cache",
-    # Version Control
-    ".git",
-    ".svn",
-    ".hg",
-    # Build Output
-    "build",
-    "dist",
-    "target",
-    "out",
-    # IDEs
-    ".idea",
-    ".vscode",
-    ".sublime",
-    ".atom",
-    ".brackets",
-    # Temporary / Cache
-    ".cache",
-    ".temp",
-    ".tmp",
-    "*.swp",
-    "*.swo",
-    "*~",
-    # OS-specific
-    ".DS_Store",
-    "Thumbs.db",
-    # Java / JVM
-    ".gradle",
-    ".m2",
-    # Documentation build
-    "_build",
-    "site",
-    # Mobile development
-    ".expo",
-    ".flutter",
-    # Package managers
-    "vendor",
-}
-
-
-def is_dangerous_path(path: Path) -> bool:
+EXCLUDED_DIRS = frozenset(
+    {
+        # Python
+        "__pycache__",
+        ".venv",
+        "venv",
+        "env",
+        ".env",
+        "*.egg-info",
+        ".eggs",
+        "wheels",
+        ".Python",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".tox",
+        "htmlcov",
+        ".coverage",
+        "coverage",
+        # Node.js / JavaScript
+        "node_modules",
+        ".next",
+        ".nuxt",
+        "bower_components",
+        ".sass-cache",
+        # Version Control
+        ".git",
+        ".svn",
+        ".hg",
+        # Build Output
+        "build",
+        "dist",
+        "target",
+        "out",
+        # IDEs
+        ".idea",
+        ".vscode",
+        ".sublime",
+        ".atom",
+        ".brackets",
+        # Temporary / Cache
+        ".cache",
+        ".temp",
+        ".tmp",
+        "*.swp",
+        "*.swo",
+        "*~",
+        # OS-specific
+        ".DS_Store",
+        "Thumbs.db",
+        # Java / JVM
+        ".gradle",
+        ".m2",
+        # Documentation build
+        "_build",
+        "site",
+        # Mobile development
+        ".expo",
+        ".flutter",
+        # Package managers
+        "vendor",
+    }
+)
+
+# EXCLUDED_DIRS mixes literal names with glob patterns (e.g. "*.egg-info").
+# Split them once: literals use set membership, globs share one compiled regex.
+_EXCLUDED_GLOB_CHARS = frozenset("*?[~")
+_EXCLUDED_LITERALS = frozenset(d for d in EXCLUDED_DIRS if not _EXCLUDED_GLOB_CHARS.intersection(d))
+_EXCLUDED_GLOB_RE = re.compile(
+    "|".join(fnmatch.translate(d) for d in sorted(EXCLUDED_DIRS - _EXCLUDED_LITERALS)) or r"(?!)"
+)
+
+
+def is_excluded_dir(name: str) -> bool:
+    """
+    Check if a directory name should be skipped during recursive file search.
+
+    Args:
+        name: Directory name (a single path component, not a full path)
+
+    Returns:
+        True if the name matches an EXCLUDED_DIRS literal or glob pattern
+    """
+    return name in _EXCLUDED_LITERALS or _EXCLUDED_GLOB_RE.match(name) is not None
+
+
+def _dangerous_variants(p: Path) -> set[Path]:
+    """Return ``p`` plus its resolved form when ``p`` is absolute on this platform."""
+    variants = {p}
+    # Only resolve paths that are absolute on the current platform.
+    # This avoids turning Windows-style strings into nonsense absolute paths on POSIX.
+    if p.is_absolute():
+        try:
+            variants.add(p.resolve())
+        except (OSError, ValueError, RuntimeError):
+            pass
+    return variants
+
+
+if os.name == "nt":
+
+    def _path_key(p: Path) -> tuple[str, ...]:
+        """Comparison key for ``p``: its parts, case-folded as Windows paths compare."""
+        return tuple(part.casefold() for part in p.parts)
+
+else:
+
+    def _path_key(p: Path) -> tuple[str, ...]:
+        """Comparison key for ``p``: its parts tuple (cached by pathlib)."""
+        return p.parts
+
+
+def _matches_platform(raw: str) -> bool:
+    """Whether a dangerous path entry can match anything on the current platform.
+
+    Drive-letter entries (``C:\\Windows``) are only meaningful on Windows; on POSIX
+    they become single-segment relative paths that no resolved path can match.
+    POSIX-style rooted entries (``/etc``) are kept on Windows, but they have no
+    drive, so they are not absolute there, are never resolved, and do not match
+    any resolved (drive-qualified) path.
+    """
+    return os.name == "nt" or not PureWindowsPath(raw).drive
+
+
+# Platform-relevant subsets (the public sets above stay unchanged for compatibility)
+_ACTIVE_SYSTEM_PATHS = frozenset(p for p in DANGEROUS_SYSTEM_PATHS if _matches_platform(p))
+_ACTIVE_HOME_CONTAINERS = frozenset(p for p in DANGEROUS_HOME_CONTAINERS if _matches_platform(p))
+
+
+# Trie node markers (objects, so they can never collide with a path component)
+_BLOCK_SUBTREE = object()  # block this node and everything below it
+_BLOCK_EXACT = object()  # block this node only
+
+
+def _build_danger_trie() -> dict:
+    """Build a component trie of the dangerous paths, resolved once at import time.
+
+    Resolving the base paths handles platform symlinks (e.g., macOS /etc -> /private/etc,
+    /var -> /private/var) without re-touching the filesystem on every is_dangerous_path() call.
+    """
+    trie: dict = {}
+
+    def insert(paths, marker):
+        for raw in paths:
+            for variant in _dangerous_variants(Path(raw)):
+                node = trie
+                for part in _path_key(variant):
+                    # Interned keys let dict probes short-circuit on identity
+                    # when the looked-up component is interned too
+                    node = node.setdefault(sys.intern(part), {})
+                node[marker] = True
+
+    # Root "/" is excluded - it is handled by the filesystem root check
+    insert((p for p in _ACTIVE_SYSTEM_PATHS if p != "/"), _BLOCK_SUBTREE)
+    insert(_ACTIVE_HOME_CONTAINERS, _BLOCK_EXACT)
+    return trie
+
+
+_DANGER_TRIE = _build_danger_trie()
+
+
+def _is_dangerous_parts(parts: tuple[str, ...]) -> bool:
+    """Walk ``parts`` through the danger trie in O(depth) dict lookups."""
+    node = _DANGER_TRIE
+    for part in parts:
+        node = node.get(part)
+        if node is None:
+            return False
+        if _BLOCK_SUBTREE in node:
+            return True
+    return _BLOCK_EXACT in node
+
+
+@lru_cache(maxsize=4096)
+def _is_dangerous_resolved(resolved: str) -> bool:
+    """Classify an already resolved (or lexically normalized) absolute path string.
+
+    The result depends only on the string, never on the filesystem, so it is
+    safe to memoize; symlink resolution stays outside the cache. lru_cache is
+    thread-safe in CPython.
+    """
+    resolved_path = Path(resolved)
+
+    # Check 1: Root directory (filesystem root)
+    if resolved_path.parent == resolved_path:
+        return True
+
+    # Check 2: System paths - block exact match AND all subdirectories
+    # Check 3: Home containers - block ONLY exact match
+    # Subdirectories like /home/user/project pass through here and are
+    # handled by is_home_directory_root() in resolve_and_validate_path()
+    return _is_dangerous_parts(_path_key(resolved_path))
+
+
+def _normalize_path(path: Path, strict: bool) -> str:
+    """Return the string form used for classification (see is_dangerous_path)."""
+    if strict or not path.is_absolute():
+        return os.fspath(path.resolve())
+    return os.path.normpath(os.fspath(path))
+
+
+def is_dangerous_path(path: Path, *, strict: bool = True) -> bool:
     """
     Check if a path is in or under a dangerous directory.
 
@@ -110,6 +258,10 @@ def is_dangerous_path(path: Path) -> bool:
 
     Args:
         path: Path to check
+        strict: When True (default) the path is resolved, following symlinks.
+            Callers that already hold a resolved path can pass False to skip
+            the per-component filesystem lookups; absolute paths are then only
+            normalized lexically (relative paths are still resolved).
 
     Returns:
         True if the path is dangerous and should not be accessed
@@ -119,45 +271,41 @@ def is_dangerous_path(path: Path) -> bool:
         user access to home subdirectories.
     """
     try:
-        resolved = path.resolve()
-
-        def _dangerous_variants(p: Path) -> set[Path]:
-            variants = {p}
-            # Only resolve paths that are absolute on the current platform.
-            # This avoids turning Windows-style strings into nonsense absolute paths on POSIX.
-            if p.is_absolute():
-                try:
-                    variants.add(p.resolve())
-                except Exception:
-                    pass
-            return variants
-
-        # Check 1: Root directory (filesystem root)
-        if resolved.parent == resolved:
-            return True
+        return _is_dangerous_resolved(_normalize_path(path, strict))
+
+    except (OSError, ValueError, RuntimeError):
+        # If we can't resolve (missing component, invalid name, symlink loop),
+        # consider it dangerous; anything else is a bug and should surface
+        return True
+
+
+def filter_dangerous_paths(paths: Iterable[Path], *, strict: bool = True) -> list[Path]:
+    """
+    Filter dangerous paths out of a collection, keeping the safe ones.
+
+    Batch counterpart of is_dangerous_path() for callers validating many paths
+    (e.g. directory listings): the same rules apply, but the per-call lookups
+    are hoisted out of the loop.
+
+    Args:
+        paths: Paths to check
+        strict: Same meaning as for is_dangerous_path()
+
+    Returns:
+        The paths that are NOT dangerous, in their original order
+    """
+    normalize = _normalize_path
+    classify = _is_dangerous_resolved
+    safe = []
+    for path in paths:
+        try:
+            if not classify(normalize(path, strict)):
+                safe.append(path)
+        except (OSError, ValueError, RuntimeError):
+            continue  # Unresolvable paths are dangerous - drop them
+    return safe
+
 
-        # Check 2: System paths - block exact match AND all subdirectories
-        for dangerous in DANGEROUS_SYSTEM_PATHS:
-            # Skip root "/" - already handled above
-            if dangerous == "/":
-                continue
-
-            for dangerous_path in _dangerous_variants(Path(dangerous)):
-                # is_relative_to() correctly handles both exact matches and subdirectories.
-                # Resolving the dangerous base path also handles platform symlinks
-                # (e.g., macOS /etc -> /private/etc, /var -> /private/var).
-                if resolved == dangerous_path or resolved.is_relative_to(dangerous_path):
-                    return True
-
-        # Check 3: Home containers - block ONLY exact match
-        # Subdirectories like /home/user/project should pass through here
-        # and be handled by is_home_directory_root() in resolve_and_validate_path()
-        for container in DANGEROUS_HOME_CONTAINERS:
-            for container_path in _dangerous_variants(Path(container)):
-                if resolved == container_path:
-                    return True
-
-        return False
-
-    except Exception:
-        return True  # If we can't resolve, consider it dangerous
+def clear_dangerous_path_cache() -> None:
+    """Forget memoized path classifications (e.g. between tests that patch the filesystem)."""
+    _is_dangerous_resolved.cache_clear()
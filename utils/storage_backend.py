@@ -14,50 +14,216 @@ persisting conversation state to disk, enabling cross-process conversation conti
 Key Features:
 - Thread-safe operations using locks (both backends)
 - TTL support with automatic expiration
-- Background cleanup thread for expired data management
+- One shared background cleanup thread for expired data management
 - Singleton pattern for consistent state
 - Drop-in replacement for Redis storage
 - FileStorage: Cross-subprocess conversation persistence
 """
 
+import hashlib
+import heapq
 import json
 import logging
+import os
+import sched
+import secrets
 import threading
 import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 
-# Try to import file locking for thread safety across processes
+# Prefer orjson for (de)serializing stored payloads; fall back to stdlib json
 try:
-    import fcntl  # Unix/Linux/macOS file locking
+    import orjson
 except ImportError:
-    fcntl = None
-    try:
-        import portalocker  # Cross-platform alternative
-    except ImportError:
-        portalocker = None
+    orjson = None
 
-from utils.env import get_env
+from utils.env import get_env, get_env_bool
 
 logger = logging.getLogger(__name__)
 
 
+def _json_dumpb(obj) -> bytes:
+    """Serialize ``obj`` to UTF-8 encoded JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data: Union[str, bytes]):
+    """Parse a JSON document, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Infix of in-flight temporary files written by FileStorage._write_atomic
+_TMP_MARKER = ".tmp."
+
+# FileStorage keeps each record as two files: a tiny JSON metadata file (the
+# commit record holding the expiry) and the raw UTF-8 value next to it. Every
+# write stores its value under a fresh name that the metadata refers to
+_META_SUFFIX = ".meta"
+_VALUE_SUFFIX = ".bin"
+
+# Attempts FileStorage.get makes when a value is collected between reading its
+# metadata and opening it (the record was rewritten in the meantime)
+_READ_ATTEMPTS = 3
+
+# Number of recently read records FileStorage keeps decoded in memory
+_READ_CACHE_SIZE = 128
+
+# FileStorage cleanup yields the disk after this many due records, so a large
+# backlog of expirations does not starve concurrent reads and writes
+_CLEANUP_BATCH_SIZE = 200
+_CLEANUP_BATCH_PAUSE = 0.01
+
+
+if os.name == "nt":
+
+    def _replace(src: Path, dst: Path, attempts: int = 5) -> None:
+        """os.replace, retried while a reader briefly holds ``dst`` open (Windows denies the rename then)"""
+        for attempt in range(attempts):
+            try:
+                os.replace(src, dst)
+                return
+            except PermissionError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.01)
+
+else:
+    _replace = os.replace
+
+
+def _file_signature(st: os.stat_result) -> tuple[int, int, int]:
+    """Identify one version of a record file: atomic replaces always change the inode"""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _fsync_directory(directory: Path) -> None:
+    """fsync a directory so renames into it are durable (a no-op on Windows)"""
+    if os.name == "nt":
+        return  # Directories cannot be opened for fsync on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _new_value_name(meta_path: Path) -> str:
+    """Unique name for the value file of a new write: ``<digest>.<nonce>.bin``"""
+    return f"{meta_path.stem}.{secrets.token_hex(8)}{_VALUE_SUFFIX}"
+
+
+def _value_path(meta_path: Path, value_file: Optional[str]) -> Optional[Path]:
+    """Path of the value file a metadata file refers to, None if the reference is not valid"""
+    if (
+        not isinstance(value_file, str)
+        or not value_file.startswith(f"{meta_path.stem}.")
+        or not value_file.endswith(_VALUE_SUFFIX)
+        or os.sep in value_file
+        or (os.altsep and os.altsep in value_file)
+    ):
+        return None
+    return meta_path.with_name(value_file)
+
+
+@lru_cache(maxsize=4096)
+def _key_digest(key: str) -> str:
+    """Map a storage key to a fixed-length, filesystem-safe file stem (bounded cache)"""
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _CleanupTask:
+    """Handle for a periodic cleanup registered with _CleanupScheduler"""
+
+    def __init__(self, cleanup: Callable[[], None], interval: float):
+        # Weak reference, so a storage backend that is dropped without shutdown()
+        # is not kept alive by its own cleanup schedule
+        self._cleanup = weakref.WeakMethod(cleanup)
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Stop running the cleanup (takes effect at its next scheduled run)"""
+        self.cancelled = True
+
+
+class _CleanupScheduler:
+    """Single daemon thread running the periodic cleanups of every storage backend"""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._scheduler = sched.scheduler(time.monotonic, self._delay)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def _delay(self, timeout: float) -> None:
+        # Interruptible sleep, so a newly scheduled earlier cleanup is not missed
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def schedule(self, cleanup: Callable[[], None], interval: float) -> _CleanupTask:
+        """Run the bound method ``cleanup`` every ``interval`` seconds until cancelled"""
+        task = _CleanupTask(cleanup, interval)
+        self._enter(task)
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name="ZenStorageCleanup")
+                self._thread.start()
+                logger.debug("Started storage cleanup scheduler")
+        return task
+
+    def _enter(self, task: _CleanupTask) -> None:
+        self._scheduler.enter(task.interval, 1, self._run_task, (task,))
+        self._wakeup.set()
+
+    def _run_task(self, task: _CleanupTask) -> None:
+        cleanup = task._cleanup()
+        if task.cancelled or cleanup is None:
+            return  # Dropped from the schedule
+        try:
+            cleanup()
+        except Exception as e:
+            logger.error(f"Cleanup worker error: {e}")
+        if not task.cancelled:
+            self._enter(task)
+
+    def _run(self) -> None:
+        while True:
+            self._scheduler.run()  # Returns once the queue is empty
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+
+_cleanup_scheduler = _CleanupScheduler()
+
+
 class InMemoryStorage:
     """Thread-safe in-memory storage for conversation threads"""
 
     def __init__(self):
         self._store: dict[str, tuple[str, float]] = {}
+        # Min-heap of (expires_at, key); entries superseded by a later write are skipped when popped
+        self._expiry_heap: list[tuple[float, str]] = []
         self._lock = threading.Lock()
         # Match Redis behavior: cleanup interval based on conversation timeout
         # Run cleanup at 1/10th of timeout interval (e.g., 18 mins for 3 hour timeout)
         timeout_hours = int(get_env("CONVERSATION_TIMEOUT_HOURS", "3") or "3")
         self._cleanup_interval = (timeout_hours * 3600) // 10
         self._cleanup_interval = max(300, self._cleanup_interval)  # Minimum 5 minutes
-        self._shutdown = False
 
-        # Start background cleanup thread
-        self._cleanup_thread = threading.Thread(target=self._cleanup_worker, daemon=True)
-        self._cleanup_thread.start()
+        # Periodic cleanup runs on the shared scheduler thread
+        self._cleanup_task = _cleanup_scheduler.schedule(self._cleanup_expired, self._cleanup_interval)
 
         logger.info(
             f"In-memory storage initialized with {timeout_hours}h timeout, cleanup every {self._cleanup_interval//60}m"
@@ -68,48 +234,60 @@ class InMemoryStorage:
         with self._lock:
             expires_at = time.time() + ttl_seconds
             self._store[key] = (value, expires_at)
-            logger.debug(f"Stored key {key} with TTL {ttl_seconds}s")
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+            # Compact when rewrites have left mostly superseded entries behind
+            if len(self._expiry_heap) > 2 * len(self._store) + 64:
+                self._expiry_heap = [(exp, k) for k, (_, exp) in self._store.items()]
+                heapq.heapify(self._expiry_heap)
+        logger.debug("Stored key %s with TTL %ss", key, ttl_seconds)
 
     def get(self, key: str) -> Optional[str]:
         """Retrieve value if not expired"""
         with self._lock:
-            if key in self._store:
-                value, expires_at = self._store[key]
-                if time.time() < expires_at:
-                    logger.debug(f"Retrieved key {key}")
-                    return value
-                else:
-                    # Clean up expired entry
-                    del self._store[key]
-                    logger.debug(f"Key {key} expired and removed")
-        return None
+            entry = self._store.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            expired = time.time() >= expires_at
+            if expired:
+                # Clean up expired entry
+                del self._store[key]
+
+        # Log outside the lock so formatting never extends the critical section
+        if expired:
+            logger.debug("Key %s expired and removed", key)
+            return None
+        logger.debug("Retrieved key %s", key)
+        return value
 
     def setex(self, key: str, ttl_seconds: int, value: str) -> None:
         """Redis-compatible setex method"""
         self.set_with_ttl(key, ttl_seconds, value)
 
-    def _cleanup_worker(self):
-        """Background thread that periodically cleans up expired entries"""
-        while not self._shutdown:
-            time.sleep(self._cleanup_interval)
-            self._cleanup_expired()
+    @contextmanager
+    def write_batch(self):
+        """No-op counterpart of FileStorage.write_batch (nothing to flush in memory)"""
+        yield
 
     def _cleanup_expired(self):
         """Remove all expired entries"""
         with self._lock:
             current_time = time.time()
-            expired_keys = [k for k, (_, exp) in self._store.items() if exp < current_time]
-            for key in expired_keys:
-                del self._store[key]
+            heap = self._expiry_heap
+            expired_keys = []
+            while heap and heap[0][0] < current_time:
+                expires_at, key = heapq.heappop(heap)
+                entry = self._store.get(key)
+                if entry is not None and entry[1] == expires_at:
+                    del self._store[key]
+                    expired_keys.append(key)
 
-            if expired_keys:
-                logger.debug(f"Cleaned up {len(expired_keys)} expired conversation threads")
+        if expired_keys:
+            logger.debug("Cleaned up %d expired conversation threads", len(expired_keys))
 
     def shutdown(self):
-        """Graceful shutdown of background thread"""
-        self._shutdown = True
-        if self._cleanup_thread.is_alive():
-            self._cleanup_thread.join(timeout=1)
+        """Graceful shutdown: stop scheduling cleanups"""
+        self._cleanup_task.cancel()
 
 
 class FileStorage:
@@ -122,10 +300,13 @@ class FileStorage:
     
     Features:
     - Cross-process persistence (survives subprocess termination)
-    - Thread-safe operations with file locking
+    - Thread-safe operations with atomic file replacement
     - TTL support with automatic cleanup
     - Drop-in replacement for InMemoryStorage
     - Configurable storage directory
+
+    Each record is a small JSON metadata file plus the raw value bytes, so the
+    (potentially large) value is never escaped or parsed as JSON.
     """
     
     def __init__(self, storage_dir: Optional[str] = None):
@@ -140,115 +321,273 @@ class FileStorage:
         # Configuration
         timeout_hours = int(os.getenv("CONVERSATION_TIMEOUT_HOURS", "3"))
         self._cleanup_interval = max(60, (timeout_hours * 3600) // 60)  # Every minute minimum
-        self._shutdown = False
+        # Conversations are soft state: only pay for fsync when durability is requested
+        self._fsync = get_env_bool("ZEN_MCP_FSYNC", False)
+        # Per-thread set of files written inside write_batch() awaiting their fsync
+        self._batch = threading.local()
         self._cleanup_lock = threading.Lock()
         
-        # Start background cleanup thread (singleton pattern to avoid multiple cleaners)
-        self._start_cleanup_worker()
+        # Expiration index: file path -> (expires_at, file signature) as last seen, plus
+        # a min-heap of (expires_at, file path) so cleanup only visits entries that are
+        # due. Superseded heap entries are skipped lazily when popped.
+        self._expiry_index: dict[str, tuple[float, tuple[int, int, int], Optional[str]]] = {}
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._index_lock = threading.Lock()
+
+        # Small LRU of decoded records: key -> (file signature, value, expires_at).
+        # An entry is only used while the file's (inode, mtime, size) is unchanged,
+        # so writes from any process invalidate it.
+        self._read_cache: OrderedDict[str, tuple[tuple[int, int, int], Optional[str], float]] = OrderedDict()
+        self._read_cache_lock = threading.Lock()
+
+        # Periodic cleanup runs on the shared scheduler thread
+        self._cleanup_task = _cleanup_scheduler.schedule(self._cleanup_expired, self._cleanup_interval)
         
         logger.info(
             f"File storage initialized at {self.storage_path} with {timeout_hours}h timeout, cleanup every {self._cleanup_interval//60}m"
         )
     
-    def _start_cleanup_worker(self):
-        """Start cleanup worker with singleton pattern to avoid multiple workers"""
-        # Global cleanup worker management to prevent multiple instances
-        global _file_cleanup_worker, _file_cleanup_lock
-        if '_file_cleanup_worker' not in globals():
-            _file_cleanup_worker = None
-            _file_cleanup_lock = threading.Lock()
-        
-        with _file_cleanup_lock:
-            if _file_cleanup_worker is None or not _file_cleanup_worker.is_alive():
-                _file_cleanup_worker = threading.Thread(
-                    target=self._cleanup_worker, 
-                    daemon=True,
-                    name="ZenFileStorageCleanup"
-                )
-                _file_cleanup_worker.start()
-                logger.debug("Started file storage cleanup worker")
-    
     def setex(self, key: str, ttl_seconds: int, value: str) -> None:
         """Redis-compatible setex method"""
         self.set_with_ttl(key, ttl_seconds, value)
     
+    @contextmanager
+    def write_batch(self):
+        """Group the fsyncs of the writes made in this block (by this thread)
+
+        Writes are still applied and visible to other processes immediately;
+        only the durability flush is deferred to the end of the block, where
+        each file written is synced once (however often it was rewritten)
+        followed by its directory. Without ZEN_MCP_FSYNC there is nothing to
+        defer. Nested blocks join the outermost one.
+        """
+        if getattr(self._batch, "paths", None) is not None:
+            yield
+            return
+
+        self._batch.paths = pending = {}  # Insertion-ordered set of written paths
+        try:
+            yield
+        finally:
+            self._batch.paths = None
+            self._sync_paths(pending)
+
+    def _sync_paths(self, paths) -> None:
+        """fsync each file, then each containing directory once"""
+        directories = {}
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                continue  # Removed since it was written
+            directories[path.parent] = None
+
+        for directory in directories:
+            _fsync_directory(directory)
+
     def set_with_ttl(self, key: str, ttl_seconds: int, value: str) -> None:
         """Store value with expiration time"""
-        expires_at = time.time() + ttl_seconds
-        data = {
-            "value": value,
+        now = time.time()
+        expires_at = now + ttl_seconds
+        meta_path = self._get_file_path(key)
+        value_file = _new_value_name(meta_path)
+        meta = {
+            "key": key,
+            "value_file": value_file,
             "expires_at": expires_at,
-            "created_at": time.time()
+            "created_at": now
         }
         
-        file_path = self._get_file_path(key)
-        self._write_with_lock(file_path, data)
-        logger.debug(f"Stored key {key} to file with TTL {ttl_seconds}s")
+        # The value goes first under a name no other write uses; replacing the
+        # metadata file is the single commit point that publishes it. Whichever
+        # writer replaces the metadata last wins with its own, complete value.
+        # Superseded value files are collected by the cleanup scan.
+        self._write_atomic(meta_path.with_name(value_file), value.encode("utf-8"))
+        signature = self._write_atomic(meta_path, _json_dumpb(meta))
+        self._cache_record(key, signature, value, expires_at)
+        self._track_expiry(str(meta_path), expires_at, signature, value_file)
+        logger.debug("Stored key %s to file with TTL %ss", key, ttl_seconds)
     
     def get(self, key: str) -> Optional[str]:
         """Retrieve value if not expired"""
         file_path = self._get_file_path(key)
         
-        if not file_path.exists():
-            return None
-        
-        try:
-            data = self._read_with_lock(file_path)
-            if data is None:
+        for _ in range(_READ_ATTEMPTS):
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
+                self._forget_cached(key)
+                return self._get_legacy(key)
+            except OSError:
+                self._forget_cached(key)
                 return None
             
-            # Check expiration
-            if time.time() < data.get("expires_at", 0):
-                logger.debug(f"Retrieved key {key} from file")
-                return data.get("value")
+            with self._read_cache_lock:
+                cached = self._read_cache.get(key)
+                if cached is not None and cached[0] == _file_signature(st):
+                    self._read_cache.move_to_end(key)
+                else:
+                    cached = None
+
+            if cached is not None:
+                _, value, expires_at = cached
+                value_path = None
             else:
-                # Expired - remove file
-                self._safe_remove_file(file_path)
-                logger.debug(f"Key {key} expired and file removed")
+                record = self._read_record(file_path)
+                if record is None:
+                    return None
+                # The signature of the metadata version actually read, not the
+                # one stat() saw: the file may have been replaced in between
+                meta, signature = record
+                expires_at = meta.get("expires_at", 0)
+                value_path = _value_path(file_path, meta.get("value_file"))
+
+            # Check expiration
+            if time.time() >= expires_at:
+                # Expired - remove files
+                self._forget_cached(key)
+                self._remove_record(file_path, value_path)
+                logger.debug("Key %s expired and file removed", key)
                 return None
-                
-        except (json.JSONDecodeError, KeyError, OSError) as e:
-            logger.warning(f"Failed to read key {key}: {e}")
-            self._safe_remove_file(file_path)  # Clean up corrupted file
+
+            if cached is None:
+                if value_path is None:
+                    logger.warning(f"Record {file_path} does not name a valid value file")
+                    return None
+                # Only read the value once the metadata says it is live. Value
+                # files are never rewritten, so the pair read here is consistent.
+                value = self._read_value(value_path)
+                if value is None:
+                    continue  # Superseded and collected since the metadata was read
+                self._cache_record(key, signature, value, expires_at)
+
+            logger.debug("Retrieved key %s from file", key)
+            return value
+
+        return None
+
+    def _get_legacy(self, key: str) -> Optional[str]:
+        """Read a record written by the earlier storage layout
+
+        Earlier versions stored a record as one JSON file holding the value
+        itself, named after the key (``thread_<id>.json``). Such records stay
+        readable until they expire (cleanup removes them then) or the thread
+        is written again, which stores it in the current layout. They are not
+        rewritten here: a newer record written meanwhile by another process
+        must not be replaced.
+        """
+        safe_key = key.replace("/", "_").replace(":", "_")
+        file_path = self.storage_path / f"{safe_key}.json"
+        record = self._read_record(file_path)
+        if record is None:
             return None
+        data = record[0]
+        if time.time() >= data.get("expires_at", 0):
+            self._remove_record(file_path)
+            return None
+        logger.debug("Retrieved key %s from legacy file", key)
+        return data.get("value")
+
+    def _cache_record(
+        self, key: str, signature: tuple[int, int, int], value: Optional[str], expires_at: float
+    ) -> None:
+        """Remember a decoded record, evicting the least recently used beyond the cache size"""
+        with self._read_cache_lock:
+            self._read_cache[key] = (signature, value, expires_at)
+            self._read_cache.move_to_end(key)
+            if len(self._read_cache) > _READ_CACHE_SIZE:
+                self._read_cache.popitem(last=False)
+
+    def _forget_cached(self, key: str) -> None:
+        """Drop a key from the read cache"""
+        with self._read_cache_lock:
+            self._read_cache.pop(key, None)
     
     def _get_file_path(self, key: str) -> Path:
         """Get file path for a given key"""
-        # Sanitize key for filesystem compatibility
-        safe_key = key.replace("/", "_").replace(":", "_")
-        return self.storage_path / f"{safe_key}.json"
+        # Hash the key for a fixed-length safe name, sharded by its first byte so
+        # no single directory grows with the number of threads
+        digest = _key_digest(key)
+        return self.storage_path / digest[:2] / f"{digest}{_META_SUFFIX}"
     
-    def _write_with_lock(self, file_path: Path, data: dict) -> None:
-        """Write data to file with proper locking"""
+    def _write_atomic(self, file_path: Path, payload: bytes) -> tuple[int, int, int]:
+        """Write bytes to a temporary file and atomically rename it into place
+
+        Readers never observe a truncated or partially written record: they see
+        either the previous file or the complete new one. Returns the signature
+        of the written file (the rename preserves inode and mtime). With
+        ZEN_MCP_FSYNC, the file and then its directory are synced, so the rename
+        itself is durable too (inside write_batch both happen when it ends).
+        """
+        tmp_path = file_path.with_name(f"{file_path.name}{_TMP_MARKER}{os.getpid()}.{threading.get_ident()}")
+        sync_directory = False
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                if fcntl:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                elif portalocker:
-                    portalocker.lock(f, portalocker.LOCK_EX)
-                
-                json.dump(data, f, indent=2)
+            try:
+                f = open(tmp_path, 'wb')
+            except FileNotFoundError:
+                # First write into this shard
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                f = open(tmp_path, 'wb')
+            with f:
+                f.write(payload)
                 f.flush()  # Ensure data is written
-                os.fsync(f.fileno())  # Force write to disk
+                if self._fsync:
+                    batch = getattr(self._batch, "paths", None)
+                    if batch is None:
+                        os.fsync(f.fileno())  # Force write to disk
+                        sync_directory = True
+                    else:
+                        batch[file_path] = None  # Flushed when the batch ends
+                signature = _file_signature(os.fstat(f.fileno()))
+            _replace(tmp_path, file_path)
+            if sync_directory:
+                _fsync_directory(file_path.parent)
+            return signature
         except OSError as e:
+            self._safe_remove_file(tmp_path)
             logger.error(f"Failed to write file {file_path}: {e}")
             raise
     
-    def _read_with_lock(self, file_path: Path) -> Optional[dict]:
-        """Read data from file with proper locking"""
+    def _read_record(self, file_path: Path) -> Optional[tuple[dict, tuple[int, int, int]]]:
+        """Read a record's metadata written by _write_atomic, with the signature of that version
+
+        Records are replaced atomically, so readers need no lock. A file that
+        fails to parse is genuinely corrupt and the record is removed; other
+        read errors leave the files alone.
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                if fcntl:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-                elif portalocker:
-                    portalocker.lock(f, portalocker.LOCK_SH)
-                
-                return json.load(f)
-        except (OSError, json.JSONDecodeError) as e:
+            with open(file_path, 'rb') as f:
+                return _json_loads(f.read()), _file_signature(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            return None  # Missing, or removed concurrently by expiry/cleanup
+        except json.JSONDecodeError as e:
+            logger.warning(f"Removing corrupted file {file_path}: {e}")
+            self._remove_record(file_path)
+            return None
+        except OSError as e:
             logger.warning(f"Failed to read file {file_path}: {e}")
-            # Clean up corrupted file immediately
-            self._safe_remove_file(file_path)
             return None
+
+    def _read_value(self, value_path: Path) -> Optional[str]:
+        """Read the raw value a metadata file refers to"""
+        try:
+            with open(value_path, 'rb') as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None  # Removed concurrently by expiry/cleanup
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Failed to read file {value_path}: {e}")
+            return None
+
+    def _remove_record(self, file_path: Path, value_path: Optional[Path] = None) -> None:
+        """Remove a record: its metadata first, so readers stop seeing it, then its value"""
+        self._safe_remove_file(file_path)
+        if value_path is not None:
+            self._safe_remove_file(value_path)
     
     def _safe_remove_file(self, file_path: Path) -> None:
         """Safely remove a file, ignoring errors"""
@@ -257,16 +596,86 @@ class FileStorage:
         except OSError:
             pass  # Ignore removal errors
     
-    def _cleanup_worker(self):
-        """Background thread that periodically cleans up expired files"""
-        while not self._shutdown:
+    def _track_expiry(
+        self, path: str, expires_at: float, signature: tuple[int, int, int], value_file: Optional[str] = None
+    ) -> None:
+        """Record the expiration time (and value file) of a stored file version in the cleanup index"""
+        with self._index_lock:
+            self._expiry_index[path] = (expires_at, signature, value_file)
+            heapq.heappush(self._expiry_heap, (expires_at, path))
+            # Compact when rewrites have left mostly superseded entries behind
+            if len(self._expiry_heap) > 2 * len(self._expiry_index) + 64:
+                self._expiry_heap = [(entry[0], p) for p, entry in self._expiry_index.items()]
+                heapq.heapify(self._expiry_heap)
+
+    def _index_record(self, path: str) -> None:
+        """Read a record's expiration time and value file into the cleanup index"""
+        record = self._read_record(Path(path))
+        if record is not None:
+            data, signature = record
+            self._track_expiry(path, data.get("expires_at", 0), signature, data.get("value_file"))
+
+    def _scan_storage_dir(self, current_time: float) -> None:
+        """Reconcile the expiration index with the files currently on disk
+
+        Decisions are made from directory entries and stat() alone: a record is
+        only opened when it is new or has been rewritten (by any process) since
+        it was indexed. Stale temp files and value files no metadata refers to
+        (superseded by a later write, or left by a writer that died before
+        committing) are removed along the way once older than the cleanup
+        interval. Single-file .json records at the top level, from the earlier
+        storage layout, are expired the same way.
+        """
+        present = {}
+        values = []
+
+        def scan(directory, descend):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    name = entry.name
+                    try:
+                        if _TMP_MARKER in name:
+                            # Temporary file left behind by a writer that died mid-write
+                            if current_time - entry.stat().st_mtime > self._cleanup_interval:
+                                self._safe_remove_file(Path(entry.path))
+                        elif name.endswith(_VALUE_SUFFIX):
+                            values.append(entry)
+                        elif name.endswith(_META_SUFFIX) or (descend and name.endswith(".json")):
+                            present[entry.path] = _file_signature(entry.stat())
+                        elif descend and len(name) == 2 and entry.is_dir():
+                            scan(entry.path, False)
+                    except OSError:
+                        pass  # Removed while scanning
+
+        scan(self.storage_path, True)
+
+        with self._index_lock:
+            index = self._expiry_index
+            for path in index.keys() - present.keys():
+                del index[path]
+            changed = [path for path, signature in present.items() if index.get(path, (0, None))[1] != signature]
+
+        for path in changed:
+            self._index_record(path)
+
+        with self._index_lock:
+            referenced = {
+                os.path.join(os.path.dirname(path), entry[2]) for path, entry in self._expiry_index.items() if entry[2]
+            }
+            unindexed = present.keys() - self._expiry_index.keys()
+
+        for entry in values:
+            if entry.path in referenced:
+                continue
+            digest = entry.name.split(".", 1)[0]
+            if os.path.join(os.path.dirname(entry.path), digest + _META_SUFFIX) in unindexed:
+                continue  # Its metadata could not be read; keep the value to be safe
             try:
-                time.sleep(self._cleanup_interval)
-                if not self._shutdown:
-                    self._cleanup_expired()
-            except Exception as e:
-                logger.error(f"Cleanup worker error: {e}")
-                time.sleep(60)  # Wait before retrying
+                # Old enough not to be a value whose metadata is still being written
+                if current_time - entry.stat().st_mtime > self._cleanup_interval:
+                    self._safe_remove_file(Path(entry.path))
+            except OSError:
+                pass
     
     def _cleanup_expired(self) -> None:
         """Remove all expired thread files"""
@@ -278,26 +687,44 @@ class FileStorage:
             expired_files = []
             
             try:
-                for file_path in self.storage_path.glob("*.json"):
+                self._scan_storage_dir(current_time)
+
+                processed = 0
+                while True:
+                    with self._index_lock:
+                        if not self._expiry_heap or self._expiry_heap[0][0] > current_time:
+                            break
+                        expires_at, path = heapq.heappop(self._expiry_heap)
+                        entry = self._expiry_index.get(path)
+                        if entry is None or entry[0] != expires_at:
+                            continue  # Superseded by a later write
+                        del self._expiry_index[path]
+
+                    processed += 1
+                    if processed % _CLEANUP_BATCH_SIZE == 0:
+                        time.sleep(_CLEANUP_BATCH_PAUSE)
+
+                    # Another process may have rewritten the record since it was indexed
                     try:
-                        data = self._read_with_lock(file_path)
-                        if data and current_time >= data.get("expires_at", 0):
-                            self._safe_remove_file(file_path)
-                            expired_files.append(file_path.name)
-                    except Exception:
-                        # Remove corrupted files
-                        self._safe_remove_file(file_path)
-                        expired_files.append(file_path.name)
+                        unchanged = _file_signature(os.stat(path)) == entry[1]
+                    except OSError:
+                        continue  # Already gone
+                    if not unchanged:
+                        self._index_record(path)
+                        continue  # Re-queued with its current expiration time
+                    file_path = Path(path)
+                    self._remove_record(file_path, _value_path(file_path, entry[2]))
+                    expired_files.append(file_path.name)
                 
                 if expired_files:
-                    logger.debug(f"Cleaned up {len(expired_files)} expired conversation thread files")
+                    logger.debug("Cleaned up %d expired conversation thread files", len(expired_files))
                     
             except Exception as e:
                 logger.error(f"Cleanup error: {e}")
     
     def shutdown(self):
-        """Graceful shutdown"""
-        self._shutdown = True
+        """Graceful shutdown: stop scheduling cleanups"""
+        self._cleanup_task.cancel()
 
 
 # Global singleton instance
@@ -316,20 +743,25 @@ def get_storage_backend() -> Union[InMemoryStorage, FileStorage]:
     Default: "file" (solves Agent Zero/Claude subprocess execution problem)
     """
     global _storage_instance
-    if _storage_instance is None:
-        with _storage_lock:
-            if _storage_instance is None:
-                backend_type = os.getenv("STORAGE_BACKEND", "file").lower()
-                
-                if backend_type == "memory":
-                    _storage_instance = InMemoryStorage()
-                    logger.info("Initialized in-memory conversation storage")
-                elif backend_type == "file":
-                    _storage_instance = FileStorage()
-                    logger.info("Initialized file-based conversation storage (cross-process persistence)")
-                else:
-                    logger.warning(f"Unknown STORAGE_BACKEND '{backend_type}', defaulting to file storage")
-                    _storage_instance = FileStorage()
-                    logger.info("Initialized file-based conversation storage (default)")
+    # Fast path: a single global load once the backend exists. The instance stays
+    # in a module global (rather than an lru_cache) so tests can reset it.
+    instance = _storage_instance
+    if instance is not None:
+        return instance
+
+    with _storage_lock:
+        if _storage_instance is None:
+            backend_type = os.getenv("STORAGE_BACKEND", "file").lower()
+
+            if backend_type == "memory":
+                _storage_instance = InMemoryStorage()
+                logger.info("Initialized in-memory conversation storage")
+            elif backend_type == "file":
+                _storage_instance = FileStorage()
+                logger.info("Initialized file-based conversation storage (cross-process persistence)")
+            else:
+                logger.warning(f"Unknown STORAGE_BACKEND '{backend_type}', defaulting to file storage")
+                _storage_instance = FileStorage()
+                logger.info("Initialized file-based conversation storage (default)")
     
     return _storage_instance